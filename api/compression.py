@@ -0,0 +1,79 @@
+import gzip
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+
+from project import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ACCEPT_ENCODING_RE = re.compile(r'^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def _compress_gzip(data, level):
+    return gzip.compress(data, compresslevel=level)
+
+
+def _compress_brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _compress_zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+COMPRESSORS = {'gzip': _compress_gzip}
+if brotli:
+    COMPRESSORS['br'] = _compress_brotli
+if zstandard:
+    COMPRESSORS['zstd'] = _compress_zstd
+
+DEFAULT_LEVELS = {'gzip': 6, 'br': 5, 'zstd': 3}
+
+
+def choose_encoding(accept_encoding):
+    accepted = {}
+    for item in accept_encoding.split(','):
+        match = ACCEPT_ENCODING_RE.match(item)
+        if not match:
+            continue
+        encoding, quality = match.group(1).lower(), match.group(2)
+        try:
+            accepted[encoding] = float(quality) if quality else 1.0
+        except ValueError:
+            continue
+
+    preferred = getattr(settings, 'COMPRESSION_ENCODINGS', ['br', 'zstd', 'gzip'])
+    candidates = [encoding for encoding in preferred
+                  if encoding in COMPRESSORS and accepted.get(encoding, accepted.get('*', 0)) > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda encoding: accepted.get(encoding, accepted.get('*', 0)))
+
+
+def compress(data, encoding, shared=False):
+    if not shared:
+        return _compress(data, encoding)
+
+    key = 'compressed:%s:%s' % (encoding, hashlib.sha1(data).hexdigest())
+    compressed = cache.get(key)
+    metrics.CACHE_REQUESTS.inc('compressed_response', 'miss' if compressed is None else 'hit')
+    if compressed is None:
+        compressed = _compress(data, encoding)
+        cache.set(key, compressed, getattr(settings, 'COMPRESSION_CACHE_TIMEOUT', 60))
+    return compressed
+
+
+def _compress(data, encoding):
+    levels = getattr(settings, 'COMPRESSION_LEVELS', DEFAULT_LEVELS)
+    return COMPRESSORS[encoding](data, levels.get(encoding, DEFAULT_LEVELS[encoding]))
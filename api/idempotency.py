@@ -0,0 +1,67 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from functools import wraps
+
+from . import responses
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+CACHE_KEY_TMPL = 'idempotency:%s:%s'
+PENDING = 'pending'
+WAIT_INTERVAL = 0.05
+
+
+def idempotent(view):
+    @wraps(view)
+    def inner(self, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return responses.InvalidIdempotencyKeyJsonResponse()
+
+        cache_key = CACHE_KEY_TMPL % (request.user.id, hashlib.sha1(key.encode()).hexdigest())
+        fingerprint = _get_fingerprint(request)
+        if not cache.add(cache_key, (PENDING, fingerprint), settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return _replay(cache_key, fingerprint)
+
+        try:
+            response = view(self, request, *args, **kwargs)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+        if response.status_code == 409 or response.status_code >= 500:
+            # Conflicts and server errors ask the client to retry, so they are not replayed
+            cache.delete(cache_key)
+            return response
+        record = (fingerprint, response.status_code, response.content, response['Content-Type'])
+        cache.set(cache_key, record, settings.IDEMPOTENCY_KEY_TTL)
+        return response
+    return inner
+
+
+def _get_fingerprint(request):
+    items = sorted((key, request.POST.getlist(key)) for key in request.POST)
+    return hashlib.sha1(repr((request.path, items)).encode()).hexdigest()
+
+
+def _replay(cache_key, fingerprint):
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    record = cache.get(cache_key)
+    while record is not None and record[0] == PENDING and time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        record = cache.get(cache_key)
+
+    if record is None or record[0] == PENDING:
+        return responses.IdempotencyKeyInProgressJsonResponse()
+
+    record_fingerprint, status, content, content_type = record
+    if record_fingerprint != fingerprint:
+        return responses.IdempotencyKeyMismatchJsonResponse()
+
+    response = HttpResponse(content, status=status, content_type=content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
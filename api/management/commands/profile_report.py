@@ -0,0 +1,45 @@
+import io
+import os
+import pstats
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Aggregates sampled request profiles into a hot-path report per view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=getattr(settings, 'PROFILING_DIR', None),
+                            help='Directory with .prof files (defaults to PROFILING_DIR)')
+        parser.add_argument('--view', help='Report only the given view name')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Number of functions to show per view')
+        parser.add_argument('--sort', default='cumulative',
+                            help='pstats sort key, e.g. cumulative, tottime, ncalls')
+
+    def handle(self, *args, **options):
+        directory = options['dir']
+        if not directory or not os.path.isdir(directory):
+            raise CommandError('Profile directory does not exist: %s' % directory)
+
+        files_by_view = defaultdict(list)
+        for name in os.listdir(directory):
+            if not name.endswith('.prof'):
+                continue
+            view_name = name.rsplit('__', 1)[0]
+            if options['view'] and view_name != options['view']:
+                continue
+            files_by_view[view_name].append(os.path.join(directory, name))
+
+        if not files_by_view:
+            self.stdout.write('No profiles found')
+            return
+
+        for view_name, paths in sorted(files_by_view.items()):
+            stream = io.StringIO()
+            stats = pstats.Stats(*paths, stream=stream)
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+            self.stdout.write('=== %s (%d requests)' % (view_name, len(paths)))
+            self.stdout.write(stream.getvalue())
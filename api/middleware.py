@@ -0,0 +1,155 @@
+import cProfile
+import hmac
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+
+from project import metrics
+
+from . import compression, ratelimit, responses
+
+
+class ProfilingMiddleware:
+    HEADER = 'HTTP_X_PROFILE'
+    FILENAME_TMPL = '%s__%d_%d.prof'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.token = getattr(settings, 'PROFILING_TOKEN', None)
+        self.directory = getattr(settings, 'PROFILING_DIR', None)
+        self.max_files = getattr(settings, 'PROFILING_MAX_FILES', 1000)
+        if not self.directory or not (self.sample_rate or self.token):
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if not self._should_profile(request):
+            return self.get_response(request)
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        self._dump(profile, request)
+        return response
+
+    def _should_profile(self, request):
+        header = request.META.get(self.HEADER)
+        if header and self.token:
+            return hmac.compare_digest(header, self.token)
+        return random.random() < self.sample_rate
+
+    def _dump(self, profile, request):
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match else 'unresolved'
+        os.makedirs(self.directory, exist_ok=True)
+        filename = self.FILENAME_TMPL % (view_name, time.time() * 1000000, os.getpid())
+        profile.dump_stats(os.path.join(self.directory, filename))
+        self._rotate()
+
+    def _rotate(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith('.prof')]
+        if len(paths) <= self.max_files:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limits = getattr(settings, 'RATE_LIMITS', {})
+        self.store = import_string(getattr(settings, 'RATE_LIMIT_STORE', 'api.ratelimit.LocalBucketStore'))()
+        max_concurrent = getattr(settings, 'RATE_LIMIT_MAX_CONCURRENT_REQUESTS', 0)
+        self.semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        if not self.limits and not self.semaphore:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if self.semaphore is None:
+            return self.get_response(request)
+
+        if not self.semaphore.acquire(blocking=False):
+            ratelimit.shed_requests.inc('overloaded')
+            return responses.OverloadedJsonResponse(retry_after=1)
+        try:
+            return self.get_response(request)
+        finally:
+            self.semaphore.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        if view_name not in self.limits:
+            return None
+
+        capacity, rate = self.limits[view_name]
+        keys = ['%s:ip:%s' % (view_name, request.META.get('REMOTE_ADDR'))]
+        if request.user.is_authenticated:
+            keys.append('%s:user:%s' % (view_name, request.user.id))
+        retry_after = max(self.store.take(key, capacity, rate) for key in keys)
+        if retry_after:
+            ratelimit.shed_requests.inc('rate_limited:%s' % view_name)
+            return responses.TooManyRequestsJsonResponse(retry_after=retry_after)
+        return None
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not isinstance(response, responses.BaseJsonResponse) \
+                or response.has_header('Content-Encoding') \
+                or len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        response.content = compression.compress(response.content, encoding, response.shared)
+        response['Content-Length'] = str(len(response.content))
+        response['Content-Encoding'] = encoding
+        return response
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match else 'unresolved'
+        metrics.REQUESTS.inc(view_name, str(response.status_code))
+        metrics.REQUEST_DURATION.observe(duration, view_name)
+        metrics.DB_QUERIES.observe(queries[0], view_name)
+        metrics.flush()
+        return response
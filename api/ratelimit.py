@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from project import metrics
+
+shed_requests = metrics.Counter('api_shed_requests_total', 'Requests refused by RateLimitMiddleware',
+                                ('reason',))
+
+
+class BaseBucketStore:
+    def take(self, key, capacity, rate):
+        raise NotImplementedError
+
+    @staticmethod
+    def _take(bucket, capacity, rate, now):
+        tokens, updated = bucket or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens < 1:
+            return (tokens, now), (1 - tokens) / rate
+        return (tokens - 1, now), 0
+
+
+class LocalBucketStore(BaseBucketStore):
+    MAX_BUCKETS = 100000
+
+    def __init__(self):
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        with self.lock:
+            bucket, retry_after = self._take(self.buckets.pop(key, None), capacity, rate, time.time())
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        return retry_after
+
+
+class CacheBucketStore(BaseBucketStore):
+    # Shared stores can't read and write a bucket atomically, so requests are counted in fixed
+    # windows of capacity / rate seconds with cache.add and cache.incr instead
+    CACHE_KEY_TMPL = 'rate_limit:%s:%d'
+
+    def take(self, key, capacity, rate):
+        window = capacity / rate
+        now = time.time()
+        index = int(now // window)
+        key = self.CACHE_KEY_TMPL % (key, index)
+        timeout = int(window) + 1
+        cache.add(key, 0, timeout)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # The window expired between add and incr
+            count = 1 if cache.add(key, 1, timeout) else cache.incr(key)
+        if count > capacity:
+            return (index + 1) * window - now
+        return 0
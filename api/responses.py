@@ -1,9 +1,14 @@
+import math
 from django.http import JsonResponse
 from functools import wraps
 
+from project import metrics
+
 
 class BaseJsonResponse(JsonResponse):
     message = None
+    # Set when the body is the same for every user, so its compressed form can be reused
+    shared = False
 
     def __init__(self, data, success, message=None, *args, **kwargs):
         if data is None:
@@ -53,6 +58,42 @@ class NotLoggedInJsonResponse(ErrorJsonResponse):
     message = 'User is not logged in'
 
 
+class RetryAfterJsonResponse(ErrorJsonResponse):
+    def __init__(self, retry_after, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self['Retry-After'] = str(math.ceil(retry_after))
+
+
+class TooManyRequestsJsonResponse(RetryAfterJsonResponse):
+    status_code = 429
+    message = 'Too many requests'
+
+
+class OverloadedJsonResponse(RetryAfterJsonResponse):
+    status_code = 503
+    message = 'Server is overloaded'
+
+
+class InvalidIdempotencyKeyJsonResponse(ErrorJsonResponse):
+    status_code = 400
+    message = 'Idempotency-Key is too long'
+
+
+class IdempotencyKeyInProgressJsonResponse(ErrorJsonResponse):
+    status_code = 409
+    message = 'A request with this Idempotency-Key is still in progress'
+
+
+class IdempotencyKeyMismatchJsonResponse(ErrorJsonResponse):
+    status_code = 422
+    message = 'Idempotency-Key was already used for a different request'
+
+
+class DuplicateAnswerJsonResponse(ErrorJsonResponse):
+    status_code = 409
+    message = 'Answer was submitted concurrently, retry the request'
+
+
 class ValidationErrorJsonResponse(ErrorJsonResponse):
     FIELD_ERROR_MESSAGE_TMPL = '%s — %s'
     ERRORS_SPLITTER_TMPL = ' ,'
@@ -78,7 +119,8 @@ def json_handler(view):
     def inner(*args, **kwargs):
         try:
             res = view(*args, **kwargs)
-        except Exception:
+        except Exception as e:
+            metrics.EXCEPTIONS.inc(view.__qualname__, type(e).__name__)
             return ServerErrorJsonResponse()
         return res
     return inner
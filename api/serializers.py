@@ -1,16 +1,78 @@
+from datetime import timedelta
+from django.utils import timezone
+
+from questionnaire.models import Answer, Question
+
+
 class QuestionJsonSerializer:
     @classmethod
-    def serialize(cls, objects):
-        return [cls._get_obj_dict(obj) for obj in objects]
+    def serialize(cls, objects, catalog_entries=None, user_answers=None):
+        data = [cls._get_obj_dict(obj) for obj in objects]
+        if catalog_entries:
+            user_answers = user_answers or {}
+            data.extend(cls._get_closed_dict(entry, user_answers.get(question_id))
+                        for question_id, entry in catalog_entries.items())
+            data.sort(key=lambda obj_dict: obj_dict['id'])
+        return data
 
     @classmethod
     def _get_obj_dict(cls, obj):
         user_answer = obj.get_user_answer()
-        return {
-            'id': obj.id,
-            'title': obj.title,
-            'can_edit': user_answer.can_edit() if user_answer else obj.can_answer(),
-            'end_time': obj.end_time.strftime("%Y-%m-%d %H:%M:%S"),
-            'user_answer': user_answer.value if user_answer else None,
-            'real_answer': obj.real_answer
-        }
+        return dict(obj.get_catalog_entry(),
+                    can_edit=user_answer.can_edit() if user_answer else obj.can_answer(),
+                    user_answer=user_answer.value if user_answer else None)
+
+    @staticmethod
+    def _get_closed_dict(catalog_entry, user_answer):
+        return dict(catalog_entry, can_edit=False, user_answer=user_answer)
+
+
+class QuestionRowSerializer:
+    COLUMNS = {
+        'id': ('id',),
+        'title': ('title',),
+        'can_edit': ('end_time',),
+        'end_time': ('end_time',),
+        'user_answer': (),
+        'real_answer': ('real_answer',),
+    }
+    USER_ANSWER_FIELDS = ('can_edit', 'user_answer')
+
+    @classmethod
+    def get_columns(cls, fields):
+        columns = ['id']
+        for field in fields:
+            columns.extend(column for column in cls.COLUMNS[field] if column not in columns)
+        return columns
+
+    @classmethod
+    def needs_user_answers(cls, fields):
+        return any(field in cls.USER_ANSWER_FIELDS for field in fields)
+
+    @classmethod
+    def serialize(cls, rows, fields, user_answers=None):
+        user_answers = user_answers or {}
+        now = timezone.now()
+        return [cls._get_row_dict(row, fields, user_answers.get(row.id), now) for row in rows]
+
+    @classmethod
+    def _get_row_dict(cls, row, fields, user_answer, now):
+        obj_dict = {}
+        for field in fields:
+            if field == 'can_edit':
+                obj_dict[field] = cls._can_edit(row, user_answer, now)
+            elif field == 'user_answer':
+                obj_dict[field] = user_answer[0] if user_answer else None
+            elif field == 'end_time':
+                obj_dict[field] = row.end_time.strftime(Question.END_TIME_FORMAT)
+            else:
+                obj_dict[field] = getattr(row, field)
+        return obj_dict
+
+    @staticmethod
+    def _can_edit(row, user_answer, now):
+        can_answer = row.end_time >= now
+        if user_answer:
+            create_time = user_answer[1]
+            return create_time + timedelta(hours=Answer.MAX_TIME_FOR_EDIT) >= now and can_answer
+        return can_answer
@@ -1,16 +1,33 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
 from datetime import timedelta
 from django.contrib.auth.models import User, AnonymousUser
 from django.contrib.sessions.middleware import SessionMiddleware
-from django.test import TestCase, RequestFactory
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.http import HttpResponse
+from django.test import Client, TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.urls import reverse
 from unittest import mock
 
-from questionnaire.models import Question, Answer
+from project import metrics
+from questionnaire.events import LocalEventBackend
+from questionnaire.models import Question, QuestionSnapshot, Answer, Tombstone
 
-from . import responses
-from .serializers import QuestionJsonSerializer
-from .views import LoginApiView, AnswerQuestionApiView, QuestionApiView
+from . import compression, idempotency, ratelimit, responses
+from .middleware import CompressionMiddleware, ProfilingMiddleware, RateLimitMiddleware
+from .serializers import QuestionJsonSerializer, QuestionRowSerializer
+from .views import (LoginApiView, AnswerQuestionApiView, QuestionApiView, QuestionSyncApiView,
+                    QuestionEventsApiView)
 
 
 class TestBaseJsonResponse(TestCase):
@@ -53,8 +70,11 @@ class JsonHandler(TestCase):
             raise Exception('test exception')
 
         handled = responses.json_handler(error_func)
+        exceptions = metrics.EXCEPTIONS.get('JsonHandler.test_json_handler.<locals>.error_func', 'Exception')
         response = handled()
         self.assertIsInstance(response, responses.ServerErrorJsonResponse)
+        self.assertEqual(metrics.EXCEPTIONS.get('JsonHandler.test_json_handler.<locals>.error_func',
+                                                'Exception'), exceptions + 1)
 
 
 class TestQuestionJsonSerializer(TestCase):
@@ -102,6 +122,11 @@ class TestQuestionJsonSerializer(TestCase):
                              'real_answer': self.question.real_answer
                          })
 
+    def test_serialize_closed(self):
+        data = QuestionJsonSerializer.serialize([], {self.question.id: {'id': self.question.id}},
+                                                {self.question.id: self.answer.value})
+        self.assertEqual(data, [{'id': self.question.id, 'can_edit': False, 'user_answer': self.answer.value}])
+
 
 def add_session(request):
     middleware = SessionMiddleware()
@@ -109,6 +134,27 @@ def add_session(request):
     request.session.save()
 
 
+class TestQuestionRowSerializer(TestCase):
+    def test_get_columns(self):
+        self.assertEqual(QuestionRowSerializer.get_columns(['title']), ['id', 'title'])
+        self.assertEqual(QuestionRowSerializer.get_columns(['can_edit', 'end_time', 'user_answer']),
+                         ['id', 'end_time'])
+
+    def test_needs_user_answers(self):
+        self.assertFalse(QuestionRowSerializer.needs_user_answers(['id', 'title']))
+        self.assertTrue(QuestionRowSerializer.needs_user_answers(['id', 'can_edit']))
+
+    def test__can_edit(self):
+        now = timezone.now()
+        row = mock.Mock(end_time=now + timedelta(hours=1))
+        self.assertTrue(QuestionRowSerializer._can_edit(row, None, now))
+        self.assertTrue(QuestionRowSerializer._can_edit(row, (40, now), now))
+        self.assertFalse(QuestionRowSerializer._can_edit(row, (40, now - timedelta(hours=2)), now))
+
+        row = mock.Mock(end_time=now - timedelta(hours=1))
+        self.assertFalse(QuestionRowSerializer._can_edit(row, None, now))
+
+
 class TestLoginApiView(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
@@ -189,6 +235,53 @@ class TestQuestionApiView(TestCase):
         response = QuestionApiView.as_view()(request)
         self.assertIsInstance(response, responses.ValidationErrorJsonResponse)
 
+    def test_get_fields(self):
+        Answer.objects.create(user=self.user, question=self.question, value=40)
+        request = self.factory.get(reverse('questions'), {'fields': 'title,user_answer,can_edit'})
+        request.user = self.user
+        response = QuestionApiView.as_view()(request)
+        self.assertIsInstance(response, responses.SuccessJsonResponse)
+        self.assertEqual(json.loads(response.content.decode())['data'],
+                         [{'title': 'Test title', 'user_answer': 40, 'can_edit': True}])
+
+        request = self.factory.get(reverse('questions'), {'fields': 'id,real_answer'})
+        request.user = self.user
+        with self.assertNumQueries(1):
+            response = QuestionApiView.as_view()(request)
+        self.assertEqual(json.loads(response.content.decode())['data'],
+                         [{'id': self.question.id, 'real_answer': None}])
+
+        Question.objects.bulk_create([Question(title='Test title', end_time=timezone.now()) for _ in range(10)])
+        request = self.factory.get(reverse('questions'), {'fields': 'id,user_answer'})
+        request.user = self.user
+        with CaptureQueriesContext(connection) as queries:
+            response = QuestionApiView.as_view()(request)
+        self.assertEqual(len(json.loads(response.content.decode())['data']), 11)
+        self.assertFalse(any(str(self.question.id + 10) in query['sql'] for query in queries))
+
+        request = self.factory.get(reverse('questions'), {'fields': 'id,unknown'})
+        request.user = self.user
+        response = QuestionApiView.as_view()(request)
+        self.assertIsInstance(response, responses.ValidationErrorJsonResponse)
+
+    def test_get_closed(self):
+        cache.clear()
+        Answer.objects.create(user=self.user, question=self.question, value=40)
+        self.question.end_time = timezone.now() - timedelta(hours=1)
+        self.question.save()
+        QuestionSnapshot.freeze(self.question)
+        open_question = Question.objects.create(title='Open title',
+                                                end_time=timezone.now() + timedelta(hours=1))
+
+        request = self.factory.get(reverse('questions'))
+        request.user = self.user
+        QuestionApiView.as_view()(request)
+        with self.assertNumQueries(4):
+            response = QuestionApiView.as_view()(request)
+        data = json.loads(response.content.decode())['data']
+        self.assertEqual([(item['id'], item['title'], item['can_edit'], item['user_answer']) for item in data],
+                         [(self.question.id, 'Test title', False, 40), (open_question.id, 'Open title', True, None)])
+
     @mock.patch('django.utils.timezone.now')
     @mock.patch('questionnaire.forms.QuestionFilterForm.TRUE', 'true')
     def test__get_params(self, now):
@@ -197,7 +290,6 @@ class TestQuestionApiView(TestCase):
         filter_params, exclude_params = QuestionApiView._get_params(cleaned_data, self.user)
         self.assertEqual(filter_params, {
             'end_time__gte': 'now',
-            'answer__user': self.user,
             'title__icontains': 'TesT'
         })
         self.assertEqual(exclude_params, {})
@@ -205,9 +297,352 @@ class TestQuestionApiView(TestCase):
         cleaned_data = {'active': 'false', 'has_answer': 'false'}
         filter_params, exclude_params = QuestionApiView._get_params(cleaned_data, self.user)
         self.assertEqual(filter_params, {'end_time__lt': 'now'})
-        self.assertEqual(exclude_params, {'answer__user': self.user})
+        self.assertEqual(exclude_params, {})
 
         cleaned_data = {}
         filter_params, exclude_params = QuestionApiView._get_params(cleaned_data, self.user)
         self.assertEqual(filter_params, {})
         self.assertEqual(exclude_params, {})
+
+    @mock.patch('questionnaire.forms.QuestionFilterForm.TRUE', 'true')
+    def test__filter_by_answer(self):
+        cache.clear()
+        answered_question = Question.objects.create(title='Answered title',
+                                                    end_time=timezone.now() + timedelta(hours=1))
+        Answer.objects.create(user=self.user, question=answered_question, value=40)
+        questions = Question.objects.all()
+
+        filtered = QuestionApiView._filter_by_answer(questions, 'true', self.user)
+        self.assertEqual(list(filtered), [answered_question])
+
+        filtered = QuestionApiView._filter_by_answer(questions, 'false', self.user)
+        self.assertEqual(list(filtered), [self.question])
+
+    def test_get_has_answer(self):
+        answered_question = Question.objects.create(title='Answered title',
+                                                    end_time=timezone.now() + timedelta(hours=1))
+        Answer.objects.create(user=self.user, question=answered_question, value=40)
+        self.client.force_login(self.user)
+
+        for params in ({}, {'fields': 'id,user_answer'}):
+            response = self.client.get(reverse('questions'), dict(params, has_answer='true'))
+            data = response.json()['data']
+            self.assertTrue(response.json()['success'])
+            self.assertEqual([(item['id'], item['user_answer']) for item in data],
+                             [(answered_question.id, 40)])
+
+            response = self.client.get(reverse('questions'), dict(params, has_answer='false'))
+            data = response.json()['data']
+            self.assertEqual([(item['id'], item['user_answer']) for item in data], [(self.question.id, None)])
+
+    def test_get_closed_has_answer(self):
+        closed_question = Question.objects.create(title='Closed title',
+                                                  end_time=timezone.now() - timedelta(hours=1))
+        Answer.objects.create(user=self.user, question=closed_question, value=40)
+        QuestionSnapshot.freeze(closed_question)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('questions'), {'has_answer': 'true'})
+        self.assertEqual([(item['id'], item['title'], item['can_edit'], item['user_answer'])
+                          for item in response.json()['data']],
+                         [(closed_question.id, 'Closed title', False, 40)])
+
+        response = self.client.get(reverse('questions'), {'has_answer': 'false'})
+        self.assertEqual([item['id'] for item in response.json()['data']], [self.question.id])
+
+
+class TestProfilingMiddleware(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_response(self, request):
+        request.resolver_match = mock.Mock(view_name='questions')
+        return HttpResponse()
+
+    def test_init(self):
+        with override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_TOKEN=None, PROFILING_DIR=self.directory):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(self.get_response)
+
+    def test_call(self):
+        with override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_TOKEN='secret',
+                               PROFILING_DIR=self.directory, PROFILING_MAX_FILES=2):
+            middleware = ProfilingMiddleware(self.get_response)
+
+            middleware(self.factory.get('/api/questions', HTTP_X_PROFILE='wrong'))
+            self.assertEqual(os.listdir(self.directory), [])
+
+            for _ in range(3):
+                middleware(self.factory.get('/api/questions', HTTP_X_PROFILE='secret'))
+            profiles = os.listdir(self.directory)
+            self.assertEqual(len(profiles), 2)
+            self.assertTrue(all(name.startswith('questions__') for name in profiles))
+
+            out = io.StringIO()
+            call_command('profile_report', stdout=out)
+            self.assertIn('=== questions (2 requests)', out.getvalue())
+
+
+class TestRateLimitMiddleware(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.shed_requests.clear()
+        self.factory = RequestFactory()
+
+    @override_settings(RATE_LIMITS={'login': (2, 0.1)}, RATE_LIMIT_STORE='api.ratelimit.CacheBucketStore')
+    @mock.patch('api.ratelimit.time.time', mock.Mock(return_value=1010))
+    def test_rate_limit(self):
+        client = Client()
+        for _ in range(2):
+            response = client.post(reverse('login'), {'username': 'test', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+
+        response = client.post(reverse('login'), {'username': 'test', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertFalse(response.json()['success'])
+        self.assertEqual(ratelimit.shed_requests.get('rate_limited:login'), 1)
+
+        response = client.get(reverse('questions'))
+        self.assertEqual(response.status_code, 200)
+
+        response = client.get(reverse('admin:login'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(RATE_LIMITS={}, RATE_LIMIT_MAX_CONCURRENT_REQUESTS=1)
+    def test_concurrency_limit(self):
+        middleware = RateLimitMiddleware(lambda request: HttpResponse())
+        middleware.semaphore.acquire()
+        response = middleware(self.factory.get(reverse('questions')))
+        self.assertIsInstance(response, responses.OverloadedJsonResponse)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(ratelimit.shed_requests.get('overloaded'), 1)
+
+        middleware.semaphore.release()
+        response = middleware(self.factory.get(reverse('questions')))
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_bucket_store(self):
+        store = ratelimit.CacheBucketStore()
+        with mock.patch('api.ratelimit.time.time', return_value=1005):
+            self.assertEqual([store.take('key', 2, 0.1) for _ in range(3)], [0, 0, 15])
+        with mock.patch('api.ratelimit.time.time', return_value=1020):
+            self.assertEqual(store.take('key', 2, 0.1), 0)
+
+    def test_local_bucket_store(self):
+        store = ratelimit.LocalBucketStore()
+        self.assertEqual(store.take('key', 1, 0.5), 0)
+        self.assertAlmostEqual(store.take('key', 1, 0.5), 2, places=2)
+
+
+class TestQuestionSyncApiView(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username='test', password='testtest')
+        self.questions = [Question.objects.create(title='Test title %d' % i,
+                                                  end_time=timezone.now() + timedelta(hours=1))
+                          for i in range(3)]
+
+    def sync(self, **params):
+        request = self.factory.get(reverse('questions_sync'), params)
+        request.user = self.user
+        response = QuestionSyncApiView.as_view()(request)
+        self.assertIsInstance(response, responses.SuccessJsonResponse)
+        return json.loads(response.content.decode())['data']
+
+    def test_get(self):
+        data = self.sync()
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['questions']), 3)
+
+        since = timezone.now().strftime(QuestionSyncApiView.WATERMARK_FORMAT)
+        data = self.sync(since=since)
+        self.assertFalse(data['full'])
+        self.assertEqual(data['questions'], [])
+        self.assertEqual(data['deleted'], [])
+
+        self.questions[0].real_answer = 80
+        self.questions[0].save()
+        answer = Answer.objects.create(user=self.user, question=self.questions[1], value=40)
+        deleted_id = self.questions[2].id
+        Answer.objects.create(user=self.user, question=self.questions[2], value=60)
+        self.questions[2].delete()
+        self.assertEqual(list(Tombstone.objects.values_list('question_id', 'user_id')), [(deleted_id, None)])
+        data = self.sync(since=since)
+        self.assertEqual(sorted(question['id'] for question in data['questions']),
+                         [self.questions[0].id, self.questions[1].id])
+        self.assertEqual(data['deleted'], [deleted_id])
+
+        since = timezone.now().strftime(QuestionSyncApiView.WATERMARK_FORMAT)
+        answer.delete()
+        data = self.sync(since=since)
+        self.assertEqual(data['questions'][0]['id'], self.questions[1].id)
+        self.assertIsNone(data['questions'][0]['user_answer'])
+
+    @override_settings(SYNC_TOMBSTONE_TTL=timedelta(days=1))
+    def test_get_expired_watermark(self):
+        since = (timezone.now() - timedelta(days=2)).strftime(QuestionSyncApiView.WATERMARK_FORMAT)
+        data = self.sync(since=since)
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['questions']), 3)
+
+
+class TestCompression(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    @override_settings(COMPRESSION_ENCODINGS=['br', 'gzip'])
+    def test_choose_encoding(self):
+        self.assertEqual(compression.choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(compression.choose_encoding('*'), 'br' if compression.brotli else 'gzip')
+        self.assertEqual(compression.choose_encoding('br;q=0.5, gzip'), 'gzip')
+        self.assertIsNone(compression.choose_encoding('gzip;q=0, deflate'))
+        self.assertIsNone(compression.choose_encoding(''))
+
+    @override_settings(COMPRESSION_ENCODINGS=['gzip'], COMPRESSION_MIN_SIZE=100)
+    def test_middleware(self):
+        data = [{'id': i, 'title': 'Test title'} for i in range(100)]
+
+        def get_response(request):
+            response = responses.SuccessJsonResponse(data)
+            response.shared = True
+            return response
+
+        middleware = CompressionMiddleware(get_response)
+        response = middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(json.loads(gzip.decompress(response.content).decode())['data'], data)
+
+        with mock.patch('api.compression._compress') as _compress:
+            cached = middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+            self.assertEqual(_compress.call_count, 0)
+        self.assertEqual(cached.content, response.content)
+
+        response = middleware(self.factory.get('/'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        middleware = CompressionMiddleware(lambda request: responses.NotLoggedInJsonResponse())
+        response = middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class TestQuestionEventsApiView(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username='test', password='testtest')
+        self.backend = LocalEventBackend()
+
+    @override_settings(EVENTS_STREAM_TIMEOUT=0.1, EVENTS_HEARTBEAT=0.01)
+    def test_get(self):
+        self.backend.publish('question_created', {'id': 1})
+        self.backend.publish('answer_saved', {'question': 1}, user_id=self.user.id + 1)
+        self.backend.publish('answer_saved', {'question': 1}, user_id=self.user.id)
+
+        request = self.factory.get(reverse('questions_events'), HTTP_LAST_EVENT_ID='0')
+        request.user = self.user
+        with mock.patch('questionnaire.events.get_backend', return_value=self.backend):
+            response = QuestionEventsApiView.as_view()(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('id: 1\nevent: question_created\ndata: {"id": 1}\n\n', content)
+        self.assertNotIn('id: 2\n', content)
+        self.assertIn('id: 3\nevent: answer_saved\n', content)
+        self.assertIn(': heartbeat\n\n', content)
+
+    def test_get_not_logged_in(self):
+        request = self.factory.get(reverse('questions_events'))
+        request.user = AnonymousUser()
+        response = QuestionEventsApiView.as_view()(request)
+        self.assertIsInstance(response, responses.NotLoggedInJsonResponse)
+
+
+class TestIdempotency(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username='test', password='testtest')
+        self.question = Question.objects.create(title='Test title',
+                                                end_time=timezone.now() + timedelta(hours=1))
+
+    def post(self, data, key='key'):
+        request = self.factory.post(reverse('answer_question'), data, HTTP_IDEMPOTENCY_KEY=key)
+        request.user = self.user
+        return AnswerQuestionApiView.as_view()(request)
+
+    def test_replay(self):
+        response = self.post({'question': self.question.id, 'value': 70})
+        self.assertIsInstance(response, responses.SuccessJsonResponse)
+
+        with mock.patch('questionnaire.forms.AnswerForm.is_valid') as is_valid:
+            replayed = self.post({'question': self.question.id, 'value': 70})
+            self.assertEqual(is_valid.call_count, 0)
+        self.assertEqual(replayed.content, response.content)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(Answer.objects.count(), 1)
+
+        response = self.post({'question': self.question.id, 'value': 80})
+        self.assertIsInstance(response, responses.IdempotencyKeyMismatchJsonResponse)
+
+        response = self.post({'question': self.question.id, 'value': 80}, key='x' * 256)
+        self.assertIsInstance(response, responses.InvalidIdempotencyKeyJsonResponse)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.1)
+    def test_in_progress(self):
+        data = {'question': self.question.id, 'value': 70}
+        request = self.factory.post(reverse('answer_question'), data)
+        cache_key = idempotency.CACHE_KEY_TMPL % (self.user.id, hashlib.sha1(b'key').hexdigest())
+        cache.add(cache_key, (idempotency.PENDING, idempotency._get_fingerprint(request)))
+
+        response = self.post(data)
+        self.assertIsInstance(response, responses.IdempotencyKeyInProgressJsonResponse)
+        self.assertEqual(Answer.objects.count(), 0)
+
+    def test_conflict(self):
+        data = {'question': self.question.id, 'value': 70}
+        with mock.patch('questionnaire.models.Answer.save', side_effect=IntegrityError):
+            response = self.post(data)
+        self.assertIsInstance(response, responses.DuplicateAnswerJsonResponse)
+
+        response = self.post(data)
+        self.assertIsInstance(response, responses.SuccessJsonResponse)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Answer.objects.count(), 1)
+
+    @mock.patch('questionnaire.forms.AnswerForm.is_valid')
+    def test_error(self, is_valid):
+        is_valid.side_effect = Exception('test exception')
+        response = self.post({'question': self.question.id, 'value': 70})
+        self.assertIsInstance(response, responses.ServerErrorJsonResponse)
+
+        is_valid.side_effect = None
+        is_valid.return_value = False
+        response = self.post({'question': self.question.id, 'value': 70})
+        self.assertIsInstance(response, responses.ValidationErrorJsonResponse)
+
+
+class TestMetricsMiddleware(TestCase):
+    def test_call(self):
+        requests = metrics.REQUESTS.get('questions', '200')
+        response = Client().get(reverse('questions'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.REQUESTS.get('questions', '200'), requests + 1)
+        self.assertIn(('questions',), metrics.REQUEST_DURATION.values)
+        self.assertIn(('questions',), metrics.DB_QUERIES.values)
+
+    def test_metrics_view(self):
+        Client().get(reverse('questions'))
+        response = Client(REMOTE_ADDR='127.0.0.1').get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('api_requests_total{view="questions",status="200"}', response.content.decode())
+
+        response = Client(REMOTE_ADDR='10.0.0.1').get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
@@ -1,9 +1,12 @@
 from django.urls import re_path
 
-from .views import LoginApiView, AnswerQuestionApiView, QuestionApiView
+from .views import (LoginApiView, AnswerQuestionApiView, QuestionApiView, QuestionSyncApiView,
+                    QuestionEventsApiView)
 
 urlpatterns = [
     re_path(r'^login/?$', LoginApiView.as_view(), name='login'),
     re_path(r'^answer_question/?$', AnswerQuestionApiView.as_view(), name='answer_question'),
-    re_path(r'^questions/?$', QuestionApiView.as_view(), name='questions')
+    re_path(r'^questions/?$', QuestionApiView.as_view(), name='questions'),
+    re_path(r'^questions/sync/?$', QuestionSyncApiView.as_view(), name='questions_sync'),
+    re_path(r'^questions/events/?$', QuestionEventsApiView.as_view(), name='questions_events')
 ]
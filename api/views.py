@@ -1,13 +1,21 @@
+import json
+import time
+from datetime import timedelta
+from django.conf import settings
 from django.contrib.auth import authenticate, login
-from django.db.models import Prefetch
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.views.generic import View
 from django.utils import timezone
 
-from questionnaire.forms import AnswerForm, QuestionFilterForm
-from questionnaire.models import Answer, Question
+from project import metrics
+from questionnaire import events
+from questionnaire.forms import AnswerForm, QuestionFilterForm, QuestionSyncForm
+from questionnaire.models import Answer, Question, QuestionSnapshot, Tombstone
 
-from . import responses
-from .serializers import QuestionJsonSerializer
+from . import idempotency, responses
+from .serializers import QuestionJsonSerializer, QuestionRowSerializer
 
 
 class LoginApiView(View):
@@ -28,6 +36,7 @@ class LoginApiView(View):
 
 class AnswerQuestionApiView(View):
     @responses.json_handler
+    @idempotency.idempotent
     def post(self, request):
         if not request.user.is_authenticated:
             return responses.NotLoggedInJsonResponse()
@@ -40,7 +49,11 @@ class AnswerQuestionApiView(View):
         if form.is_valid():
             answer = form.save(commit=False)
             answer.user = request.user
-            answer.save()
+            try:
+                with transaction.atomic():
+                    answer.save()
+            except IntegrityError:
+                return responses.DuplicateAnswerJsonResponse()
             return responses.SuccessJsonResponse(
                 message='Answer object was created/updated')
 
@@ -56,19 +69,62 @@ class QuestionApiView(View):
         form = QuestionFilterForm(request.GET)
         if form.is_valid():
             filter_params, exclude_params = self._get_params(form.cleaned_data, request.user)
-            answers = Prefetch(
-                'answer_set',
-                queryset=Answer.objects.filter(user=request.user),
-                to_attr='user_answer')
             questions = Question.objects\
-                .prefetch_related(answers)\
                 .filter(**filter_params)\
                 .exclude(**exclude_params)
-            data = QuestionJsonSerializer.serialize(questions)
-            return responses.SuccessJsonResponse(data)
+
+            fields = form.cleaned_data.get('fields')
+            if fields:
+                columns = QuestionRowSerializer.get_columns(fields)
+                questions = questions.values_list(*columns, named=True)
+
+            has_answer = form.cleaned_data.get('has_answer')
+            if has_answer:
+                questions = self._filter_by_answer(questions, has_answer, request.user)
+
+            if fields:
+                data = self._serialize_rows(questions, fields, request.user)
+            else:
+                data = self._serialize(questions, request.user)
+            response = responses.SuccessJsonResponse(data)
+            response.shared = not has_answer and bool(fields) \
+                and not QuestionRowSerializer.needs_user_answers(fields)
+            return response
 
         return responses.ValidationErrorJsonResponse(form.errors)
 
+    @staticmethod
+    def _serialize(questions, user):
+        # Closed questions are served from their snapshots, only their ids are read from the table
+        closed_questions = questions.filter(closed=True)
+        closed = list(closed_questions.values_list('id', 'update_time'))
+        catalog_entries = QuestionSnapshot.get_catalog_entries(closed)
+        user_answers = None
+        if catalog_entries:
+            user_answers = dict(Answer.objects
+                                .filter(user=user, question_id__in=closed_questions.values('id'))
+                                .values_list('question_id', 'value'))
+
+        missing = [question_id for question_id, _ in closed if question_id not in catalog_entries]
+        answers = Prefetch(
+            'answer_set',
+            queryset=Answer.objects.filter(user=user),
+            to_attr='user_answer')
+        questions = list(questions.filter(Q(closed=False) | Q(id__in=missing)))
+        prefetch_related_objects(questions, answers)
+        return QuestionJsonSerializer.serialize(questions, catalog_entries, user_answers)
+
+    @staticmethod
+    def _serialize_rows(rows, fields, user):
+        user_answers = None
+        if QuestionRowSerializer.needs_user_answers(fields):
+            answers = Answer.objects\
+                .filter(user=user, question_id__in=rows.values('id'))\
+                .values_list('question_id', 'value', 'create_time')
+            user_answers = {question_id: (value, create_time)
+                            for question_id, value, create_time in answers}
+        return QuestionRowSerializer.serialize(rows, fields, user_answers)
+
     @staticmethod
     def _get_params(cleaned_data, user):
         filter_params = {}
@@ -81,16 +137,110 @@ class QuestionApiView(View):
             else:
                 filter_params['end_time__lt'] = now
 
-        has_answer = cleaned_data.get('has_answer')
-        if has_answer:
-            if has_answer == QuestionFilterForm.TRUE:
-                filter_params['answer__user'] = user
-            else:
-                exclude_params['answer__user'] = user
-
         title = cleaned_data.get('title')
         if title:
             filter_params['title__icontains'] = title
 
         return filter_params, exclude_params
 
+    @staticmethod
+    def _filter_by_answer(questions, has_answer, user):
+        if has_answer == QuestionFilterForm.TRUE:
+            return questions.filter(answer__user=user)
+        return questions.exclude(answer__user=user)
+
+
+class QuestionSyncApiView(QuestionApiView):
+    WATERMARK_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+    WATERMARK_OVERLAP = timedelta(seconds=5)
+
+    @responses.json_handler
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return responses.NotLoggedInJsonResponse()
+
+        form = QuestionSyncForm(request.GET)
+        if form.is_valid():
+            now = timezone.now()
+            since = form.cleaned_data.get('since')
+            full = since is None or since < now - settings.SYNC_TOMBSTONE_TTL
+            if full:
+                questions = Question.objects.all()
+                deleted = []
+            else:
+                questions, deleted = self._get_changes(since, request.user)
+
+            data = {
+                'questions': self._serialize(questions, request.user),
+                'deleted': deleted,
+                'full': full,
+                'watermark': (now - self.WATERMARK_OVERLAP).strftime(self.WATERMARK_FORMAT)
+            }
+            return responses.SuccessJsonResponse(data)
+
+        return responses.ValidationErrorJsonResponse(form.errors)
+
+    @staticmethod
+    def _get_changes(since, user):
+        answered = Answer.objects\
+            .filter(user=user, update_time__gt=since)\
+            .values('question_id')
+        unanswered = Tombstone.objects\
+            .filter(user=user, delete_time__gt=since)\
+            .values('question_id')
+        questions = Question.objects.filter(
+            Q(update_time__gt=since) | Q(id__in=answered) | Q(id__in=unanswered))
+        deleted = list(Tombstone.objects
+                       .filter(user=None, delete_time__gt=since)
+                       .values_list('question_id', flat=True))
+        return questions, deleted
+
+
+class QuestionEventsApiView(View):
+    RESET_EVENT = 'reset'
+
+    @responses.json_handler
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return responses.NotLoggedInJsonResponse()
+
+        backend = events.get_backend()
+        last_id = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+        last_id = int(last_id) if last_id and last_id.isdigit() else backend.get_last_id()
+
+        response = StreamingHttpResponse(self._stream(backend, request.user.id, last_id),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _stream(self, backend, user_id, last_id):
+        deadline = time.monotonic() + settings.EVENTS_STREAM_TIMEOUT
+        yield 'retry: %d\n\n' % (settings.EVENTS_RETRY * 1000)
+        while time.monotonic() < deadline:
+            new_events = backend.wait(last_id, settings.EVENTS_HEARTBEAT)
+            if new_events is None:
+                last_id = backend.get_last_id()
+                yield self._format(last_id, self.RESET_EVENT, {})
+                continue
+            if not new_events:
+                yield ': heartbeat\n\n'
+                continue
+
+            for event in new_events:
+                last_id = event.id
+                if event.user_id is None or event.user_id == user_id:
+                    yield self._format(event.id, event.kind, event.data)
+
+    @staticmethod
+    def _format(event_id, kind, data):
+        return 'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, kind, json.dumps(data))
+
+
+class MetricsView(View):
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def get(self, request):
+        if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+            return HttpResponseForbidden()
+        return HttpResponse(metrics.render(metrics.collect()), content_type=self.CONTENT_TYPE)
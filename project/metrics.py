@@ -0,0 +1,191 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+
+REGISTRY = OrderedDict()
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+class Counter:
+    TYPE = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        REGISTRY[name] = self
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def clear(self):
+        with _lock:
+            self.values.clear()
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+    def samples(self, values):
+        for labels, value in sorted(values.items()):
+            yield self.name, self._labels(labels), value
+
+    def _labels(self, labels, **extra):
+        pairs = list(zip(self.labelnames, labels)) + list(extra.items())
+        return OrderedDict(pairs)
+
+
+class Histogram(Counter):
+    TYPE = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, amount, *labels):
+        index = bisect_left(self.buckets, amount)
+        with _lock:
+            value = self.values.get(labels)
+            if value is None:
+                # Per-bucket counts, then the +Inf bucket, then the sum of observations
+                value = self.values[labels] = [0] * (len(self.buckets) + 2)
+            value[index] += 1
+            value[-1] += amount
+
+    @staticmethod
+    def merge(value, other):
+        return [a + b for a, b in zip(value, other)]
+
+    def samples(self, values):
+        for labels, value in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), value):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                yield self.name + '_bucket', self._labels(labels, le=le), cumulative
+            yield self.name + '_sum', self._labels(labels), value[-1]
+            yield self.name + '_count', self._labels(labels), cumulative
+
+
+REQUESTS = Counter('api_requests_total', 'Handled requests', ('view', 'status'))
+REQUEST_DURATION = Histogram('api_request_duration_seconds', 'Request latency', ('view',))
+DB_QUERIES = Histogram('api_db_queries', 'Database queries per request', ('view',),
+                       buckets=(1, 2, 5, 10, 20, 50, 100))
+EXCEPTIONS = Counter('api_exceptions_total', 'Exceptions turned into server errors by json_handler',
+                     ('handler', 'exception'))
+STATISTICS_LAG = Histogram('statistics_worker_lag_seconds',
+                           'Delay between an answer save and the start of its statistics recalculation')
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups', ('cache', 'result'))
+
+
+def get_state():
+    with _lock:
+        return {name: {labels: list(value) if isinstance(value, list) else value
+                       for labels, value in metric.values.items()}
+                for name, metric in REGISTRY.items()}
+
+
+def collect():
+    state = get_state()
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if directory and os.path.isdir(directory):
+        own_filename = _get_filename()
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == own_filename:
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    _merge(state, _load(f))
+            except (OSError, ValueError, TypeError):
+                continue
+    return state
+
+
+def flush(force=False):
+    global _last_flush
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return
+    # A request finding another thread flushing skips its own flush
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        now = time.monotonic()
+        if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        _last_flush = now
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, _get_filename())
+        tmp_path = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            _dump(get_state(), f)
+        os.replace(tmp_path, path)
+    finally:
+        _flush_lock.release()
+
+
+def render(state):
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append('# HELP %s %s' % (name, metric.documentation))
+        lines.append('# TYPE %s %s' % (name, metric.TYPE))
+        for sample_name, labels, value in metric.samples(state.get(name, {})):
+            lines.append('%s%s %s' % (sample_name, _format_labels(labels), _format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def _dump(state, f):
+    # Label tuples can't be JSON object keys, so every metric is stored as [labels, value] pairs
+    json.dump({name: [[list(labels), value] for labels, value in values.items()]
+               for name, values in state.items()}, f)
+
+
+def _load(f):
+    return {name: {tuple(labels): value for labels, value in values}
+            for name, values in json.load(f).items()}
+
+
+def _merge(state, other):
+    for name, values in other.items():
+        metric = REGISTRY.get(name)
+        if metric is None:
+            continue
+        merged = state.setdefault(name, {})
+        for labels, value in values.items():
+            merged[labels] = metric.merge(merged[labels], value) if labels in merged else value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _get_filename():
+    return '%d.json' % os.getpid()
+
+
+atexit.register(lambda: flush(force=True))
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+from datetime import timedelta
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -43,13 +44,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
@@ -84,6 +89,42 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# Use a shared backend (e.g. memcached) when running several worker processes,
+# otherwise cached answered-question bitsets are only updated in one of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        }
+    }
+}
+
+ANSWERED_QUESTIONS_CACHE_TIMEOUT = 24 * 60 * 60
+QUESTION_SNAPSHOT_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+# Rate limiting
+# Token buckets per client IP and per user for each view name (including the
+# namespace, e.g. 'admin:login'), as (capacity, tokens refilled per second).
+# CacheBucketStore allows capacity requests per capacity / rate seconds window
+# instead, which can be shared by worker processes. Requests above
+# RATE_LIMIT_MAX_CONCURRENT_REQUESTS in flight in one process are shed with 503.
+
+RATE_LIMITS = {
+    'login': (5, 5 / 60),
+    'answer_question': (30, 1),
+    'questions': (30, 1),
+    'questions_sync': (30, 1),
+    'questions_events': (10, 1 / 10),
+}
+RATE_LIMIT_STORE = 'api.ratelimit.CacheBucketStore'
+RATE_LIMIT_MAX_CONCURRENT_REQUESTS = 64
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -122,6 +163,95 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+
+# Idempotent answer submission
+# Results of requests with an Idempotency-Key header are kept in the cache for
+# IDEMPOTENCY_KEY_TTL seconds. A duplicate arriving while the first request is
+# still running waits up to IDEMPOTENCY_WAIT_TIMEOUT seconds for its result.
+
+IDEMPOTENCY_KEY_TTL = 10 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+
+
+# Metrics
+# Served in the Prometheus text format at /metrics to METRICS_ALLOWED_IPS.
+# With several worker processes set METRICS_DIR to a directory shared by them
+# (cleared on deploy); every process flushes its metrics there at most once per
+# METRICS_FLUSH_INTERVAL seconds and /metrics merges them.
+
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+
+
+# Request profiling
+# Profiles a PROFILING_SAMPLE_RATE fraction of requests, plus any request whose
+# X-Profile header equals PROFILING_TOKEN. Disabled while both are unset.
+# Aggregate the results with `manage.py profile_report`.
+
+PROFILING_SAMPLE_RATE = 0
+PROFILING_TOKEN = None
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MAX_FILES = 1000
+
+
+# Response compression
+# JSON responses of at least COMPRESSION_MIN_SIZE bytes are compressed with the
+# first encoding from COMPRESSION_ENCODINGS the client accepts; br and zstd need
+# the brotli and zstandard packages. Bodies shared by all users are compressed
+# once and kept in the cache for COMPRESSION_CACHE_TIMEOUT seconds.
+
+COMPRESSION_ENCODINGS = ['br', 'zstd', 'gzip']
+COMPRESSION_LEVELS = {'gzip': 6, 'br': 5, 'zstd': 3}
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_CACHE_TIMEOUT = 60
+
+
+# Delta sync
+# Deletions are remembered for SYNC_TOMBSTONE_TTL; clients with an older
+# watermark get a full resync. Prune them with `manage.py prune_tombstones`.
+
+SYNC_TOMBSTONE_TTL = timedelta(days=30)
+
+
+# Question event stream
+# EVENTS_BACKEND is questionnaire.events.LocalEventBackend for a single process
+# or DatabaseEventBackend to share events between processes through the Event
+# table. Each open stream holds a worker thread, so serve /api/questions/events
+# with an async worker class (e.g. gevent) to keep many idle connections.
+# DatabaseEventBackend waits up to EVENTS_GAP_TIMEOUT seconds for events with
+# lower ids that aren't committed yet. consensus_changed events are published
+# by `manage.py publish_consensus --daemon`, at most once per question and pass.
+# Prune old events with `manage.py prune_events`.
+
+EVENTS_BACKEND = 'questionnaire.events.DatabaseEventBackend'
+EVENTS_POLL_INTERVAL = 1
+EVENTS_GAP_TIMEOUT = 5
+EVENTS_BUFFER_SIZE = 1000
+EVENTS_STREAM_TIMEOUT = 300
+EVENTS_HEARTBEAT = 15
+EVENTS_RETRY = 3
+EVENTS_TTL = timedelta(days=1)
+
+
+# Columnar answers export written by `manage.py export_answers`
+# Read it with questionnaire.columnar.AnswerColumns.
+
+ANSWERS_EXPORT_DIR = os.path.join(BASE_DIR, 'export', 'answers')
+
+
+# Worker warm-up
+# Steps from project.warmup.STEPS run by project.wsgi before the worker serves
+# its first request. The database step only applies to persistent connections
+# (CONN_MAX_AGE != 0). When the server imports the application before forking
+# workers, disable WSGI_WARMUP and call project.warmup.warm_up() in a post-fork
+# hook instead, so that every worker opens its own connections.
+
+WSGI_WARMUP = True
+WSGI_WARMUP_STEPS = ['urls', 'database', 'password_hasher']
+
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -135,11 +265,18 @@ LOGGING = {
             'filters': ['require_debug_true'],
             'class': 'logging.StreamHandler',
         },
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django.db.backends': {
             'level': 'DEBUG',
             'handlers': ['debug_console'],
+        },
+        'project.warmup': {
+            'level': 'INFO',
+            'handlers': ['console'],
         }
     }
 }
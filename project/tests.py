@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from django.conf import settings
+from django.test import TestCase, override_settings
+from unittest import mock
+
+from . import metrics, warmup
+
+
+class TestWarmUp(TestCase):
+    @override_settings(WSGI_WARMUP=True, WSGI_WARMUP_STEPS=['urls', 'database'])
+    def test_warm_up(self):
+        timings = warmup.warm_up()
+        self.assertEqual(list(timings), ['urls', 'database'])
+
+    def test_warm_up_database(self):
+        connection = mock.Mock(settings_dict={'CONN_MAX_AGE': 0})
+        persistent_connection = mock.Mock(settings_dict={'CONN_MAX_AGE': 60})
+        with mock.patch('django.db.connections.all', return_value=[connection, persistent_connection]):
+            warmup.warm_up_database()
+        self.assertEqual(connection.ensure_connection.call_count, 0)
+        self.assertEqual(persistent_connection.ensure_connection.call_count, 1)
+
+    @override_settings(WSGI_WARMUP=False)
+    @mock.patch('project.warmup.warm_up_urls')
+    def test_warm_up_disabled(self, warm_up_urls):
+        timings = warmup.warm_up()
+        self.assertEqual(timings, {})
+        self.assertEqual(warm_up_urls.call_count, 0)
+
+
+class TestStartupTime(TestCase):
+    IMPORT_TO_READY_BUDGET = 3.0
+    SCRIPT = (
+        'import time\n'
+        'start = time.perf_counter()\n'
+        'import project.wsgi\n'
+        'print(time.perf_counter() - start)\n'
+    )
+
+    def test_import_to_ready(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='project.settings')
+        output = subprocess.check_output([sys.executable, '-c', self.SCRIPT],
+                                         cwd=settings.BASE_DIR, env=env)
+        elapsed = float(output.decode().strip().splitlines()[-1])
+        self.assertLess(elapsed, self.IMPORT_TO_READY_BUDGET)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.counter = metrics.Counter('test_total', 'Test counter', ('view',))
+        self.histogram = metrics.Histogram('test_seconds', 'Test histogram', buckets=(0.1, 1))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        del metrics.REGISTRY['test_total']
+        del metrics.REGISTRY['test_seconds']
+
+    def test_render(self):
+        self.counter.inc('questions')
+        self.counter.inc('questions', amount=2)
+        self.histogram.observe(0.05)
+        self.histogram.observe(0.5)
+        self.histogram.observe(5)
+
+        text = metrics.render(metrics.get_state())
+        self.assertIn('# TYPE test_total counter\ntest_total{view="questions"} 3\n', text)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2\n', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn('test_seconds_sum 5.55\n', text)
+        self.assertIn('test_seconds_count 3\n', text)
+
+    def test_collect(self):
+        self.counter.inc('questions')
+        self.histogram.observe(0.5)
+        other = {'test_total': [[['questions'], 2]], 'test_seconds': [[[], [1, 0, 0, 0.05]]]}
+        with open(os.path.join(self.directory, '1.json'), 'w') as f:
+            json.dump(other, f)
+        with open(os.path.join(self.directory, '2.json'), 'w') as f:
+            f.write('{"test_total": ')
+
+        with override_settings(METRICS_DIR=self.directory):
+            metrics.flush(force=True)
+            self.assertTrue(os.path.exists(os.path.join(self.directory, '%d.json' % os.getpid())))
+            state = metrics.collect()
+        self.assertEqual(state['test_total'], {('questions',): 3})
+        self.assertEqual(state['test_seconds'], {(): [1, 1, 0, 0.55]})
+
+    def test_flush_concurrent(self):
+        with override_settings(METRICS_DIR=self.directory, METRICS_FLUSH_INTERVAL=0):
+            threads = [threading.Thread(target=metrics.flush) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(os.listdir(self.directory), ['%d.json' % os.getpid()])
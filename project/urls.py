@@ -17,7 +17,10 @@ from django.conf.urls import include
 from django.contrib import admin
 from django.urls import path
 
+from api.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path(r'api/', include('api.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
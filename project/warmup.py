@@ -0,0 +1,58 @@
+import logging
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_urls():
+    resolver = get_resolver()
+    _compile_patterns(resolver)
+    resolver.reverse_dict
+
+
+def _compile_patterns(resolver):
+    resolver.pattern.regex
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            _compile_patterns(pattern)
+        else:
+            pattern.pattern.regex
+
+
+def warm_up_database():
+    # Only persistent connections outlive the first request, and they must be opened in the
+    # worker itself: run warm_up() after the fork (e.g. in a post_fork hook) when preloading
+    for connection in connections.all():
+        if connection.settings_dict['CONN_MAX_AGE'] != 0:
+            connection.ensure_connection()
+
+
+def warm_up_password_hasher():
+    hasher = get_hasher()
+    hasher.encode('warm-up', hasher.salt())
+
+
+STEPS = OrderedDict([
+    ('urls', warm_up_urls),
+    ('database', warm_up_database),
+    ('password_hasher', warm_up_password_hasher),
+])
+
+
+def warm_up(timings=None):
+    timings = OrderedDict() if timings is None else timings
+    if getattr(settings, 'WSGI_WARMUP', False):
+        for name in getattr(settings, 'WSGI_WARMUP_STEPS', STEPS):
+            start = time.perf_counter()
+            STEPS[name]()
+            timings[name] = time.perf_counter() - start
+
+    logger.info('Worker ready in %.3fs (%s)', sum(timings.values()),
+                ', '.join('%s=%.3fs' % item for item in timings.items()))
+    return timings
@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/2.1/howto/deployment/wsgi/
 """
 
 import os
+import time
+from collections import OrderedDict
+
+start = time.perf_counter()
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_wsgi_application()
+
+from project.warmup import warm_up
+
+warm_up(OrderedDict(setup=time.perf_counter() - start))
@@ -1,6 +1,117 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR
+from django.db.models import Avg, Count
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
 
-from .models import Question
+from . import events
+from .models import Answer, Question, QuestionSnapshot
+from .paginator import EstimatedCountPaginator
 
 
-admin.site.register(Question)
+class QuestionChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        self.result_list = list(self.result_list)
+        statistics = Answer.objects\
+            .filter(question_id__in=[question.id for question in self.result_list])\
+            .values('question_id')\
+            .annotate(answers_count=Count('id'), consensus=Avg('value'))\
+            .order_by()
+        statistics = {item['question_id']: item for item in statistics}
+        for question in self.result_list:
+            item = statistics.get(question.id, {})
+            question.answers_count = item.get('answers_count', 0)
+            question.consensus = item.get('consensus')
+
+
+class QuestionAdmin(admin.ModelAdmin):
+    RESOLVE_YES = 100
+    RESOLVE_NO = 0
+
+    list_display = ('id', 'title', 'end_time', 'real_answer', 'closed', 'answers_count', 'consensus')
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['resolve_yes', 'resolve_no']
+
+    def get_changelist(self, request, **kwargs):
+        return QuestionChangeList
+
+    def answers_count(self, obj):
+        url = '%s?%s=%s' % (reverse('admin:questionnaire_answer_changelist'),
+                            QuestionListFilter.parameter_name, obj.id)
+        return format_html('<a href="{}">{}</a>', url, obj.answers_count)
+    answers_count.short_description = 'Answers'
+
+    def consensus(self, obj):
+        return round(obj.consensus) if obj.consensus is not None else None
+    consensus.short_description = 'Consensus'
+
+    def resolve_yes(self, request, queryset):
+        self._resolve(request, queryset, self.RESOLVE_YES)
+    resolve_yes.short_description = 'Resolve selected questions as %d' % RESOLVE_YES
+
+    def resolve_no(self, request, queryset):
+        self._resolve(request, queryset, self.RESOLVE_NO)
+    resolve_no.short_description = 'Resolve selected questions as %d' % RESOLVE_NO
+
+    def _resolve(self, request, queryset, real_answer):
+        # Closed questions are frozen again with the new answer by close_questions
+        question_ids = list(queryset.values_list('id', flat=True))
+        QuestionSnapshot.invalidate(queryset)
+        updated = queryset.update(real_answer=real_answer, update_time=timezone.now())
+        for question in Question.objects.filter(id__in=question_ids).iterator():
+            events.publish('question_updated', question.get_catalog_entry())
+        self.message_user(request, '%d questions were resolved as %d' % (updated, real_answer))
+
+
+class QuestionListFilter(admin.SimpleListFilter):
+    title = 'question'
+    parameter_name = 'question'
+
+    def lookups(self, request, model_admin):
+        question_id = request.GET.get(self.parameter_name, '')
+        question = Question.objects.filter(id=question_id).first() if question_id.isdigit() else None
+        return [(question.id, question)] if question else []
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(question_id=self.value())
+        return queryset
+
+
+class AnswerChangeList(ChangeList):
+    KEYSET_VAR = 'id__lt'
+
+    @property
+    def next_page_url(self):
+        if len(self.result_list) < self.list_per_page:
+            return None
+        last_id = self.result_list[len(self.result_list) - 1].id
+        return self.get_query_string({self.KEYSET_VAR: last_id}, [PAGE_VAR])
+
+    @property
+    def first_page_url(self):
+        if self.KEYSET_VAR not in self.params:
+            return None
+        return self.get_query_string(remove=[self.KEYSET_VAR, PAGE_VAR])
+
+
+class AnswerAdmin(admin.ModelAdmin):
+    list_display = ('id', 'question', 'user', 'value', 'create_time')
+    list_filter = (QuestionListFilter,)
+    list_select_related = ('question', 'user')
+    raw_id_fields = ('user', 'question')
+    ordering = ('-id',)
+    sortable_by = ()
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return AnswerChangeList
+
+
+admin.site.register(Question, QuestionAdmin)
+admin.site.register(Answer, AnswerAdmin)
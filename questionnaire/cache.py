@@ -0,0 +1,118 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from project import metrics
+
+
+class AnsweredQuestionsBitset:
+    CACHE_KEY_TMPL = 'answered_questions:%s'
+    LOCK_KEY_TMPL = 'answered_questions_lock:%s'
+    LOCK_TIMEOUT = 5
+    LOCK_WAIT_INTERVAL = 0.005
+
+    def __init__(self, data=b''):
+        self.data = bytearray(data)
+
+    def __contains__(self, question_id):
+        index = question_id >> 3
+        if index >= len(self.data):
+            return False
+        return bool(self.data[index] >> (question_id & 7) & 1)
+
+    def __iter__(self):
+        for index, byte in enumerate(self.data):
+            while byte:
+                bit = byte & -byte
+                yield (index << 3) + bit.bit_length() - 1
+                byte ^= bit
+
+    def add(self, question_id):
+        index = question_id >> 3
+        if index >= len(self.data):
+            self.data.extend(bytes(index - len(self.data) + 1))
+        self.data[index] |= 1 << (question_id & 7)
+
+    def discard(self, question_id):
+        index = question_id >> 3
+        if index < len(self.data):
+            self.data[index] &= ~(1 << (question_id & 7)) & 0xff
+
+    def count(self):
+        return bin(int.from_bytes(self.data, 'little')).count('1')
+
+    @classmethod
+    def get(cls, user):
+        key = cls._get_key(user.id)
+        data = cache.get(key)
+        metrics.CACHE_REQUESTS.inc('answered_questions', 'miss' if data is None else 'hit')
+        if data is not None:
+            return cls(data)
+
+        # Built under the lock, so an update waiting for it is applied on top of this bitset
+        # instead of being overwritten by it. Without the lock the bitset is just not cached.
+        locked = cache.add(cls._get_lock_key(user.id), True, cls.LOCK_TIMEOUT)
+        try:
+            bitset = cls._build(user)
+            if locked:
+                cache.set(key, bytes(bitset.data), cls._get_timeout())
+        finally:
+            if locked:
+                cache.delete(cls._get_lock_key(user.id))
+        return bitset
+
+    @classmethod
+    def add_answer(cls, user_id, question_id):
+        transaction.on_commit(lambda: cls._update(user_id, lambda bitset: bitset.add(question_id)))
+
+    @classmethod
+    def remove_answer(cls, user_id, question_id):
+        transaction.on_commit(lambda: cls._update(user_id, lambda bitset: bitset.discard(question_id)))
+
+    @classmethod
+    def _update(cls, user_id, action):
+        key = cls._get_key(user_id)
+        lock_key = cls._get_lock_key(user_id)
+        if not cls._acquire(lock_key):
+            # The bitset can't be updated safely, so it is rebuilt on the next read
+            cache.delete(key)
+            return
+        try:
+            data = cache.get(key)
+            if data is None:
+                return
+            bitset = cls(data)
+            action(bitset)
+            cache.set(key, bytes(bitset.data), cls._get_timeout())
+        finally:
+            cache.delete(lock_key)
+
+    @classmethod
+    def _acquire(cls, lock_key):
+        deadline = time.monotonic() + cls.LOCK_TIMEOUT
+        while not cache.add(lock_key, True, cls.LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(cls.LOCK_WAIT_INTERVAL)
+        return True
+
+    @classmethod
+    def _build(cls, user):
+        bitset = cls()
+        for question_id in user.answer_set.values_list('question_id', flat=True).iterator():
+            bitset.add(question_id)
+        return bitset
+
+    @classmethod
+    def _get_key(cls, user_id):
+        return cls.CACHE_KEY_TMPL % user_id
+
+    @classmethod
+    def _get_lock_key(cls, user_id):
+        return cls.LOCK_KEY_TMPL % user_id
+
+    @staticmethod
+    def _get_timeout():
+        return getattr(settings, 'ANSWERED_QUESTIONS_CACHE_TIMEOUT', None)
@@ -0,0 +1,113 @@
+import json
+import mmap
+import os
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class AnswerColumns:
+    # Each column is a raw little-endian file of (array typecode, numpy dtype) values
+    COLUMNS = (
+        ('id', 'q', '<i8'),
+        ('user_id', 'i', '<i4'),
+        ('question_id', 'i', '<i4'),
+        ('value', 'b', '<i1'),
+        ('create_time', 'q', '<i8'),
+    )
+    META_FILENAME = 'meta.json'
+    EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    MICROSECOND = timedelta(microseconds=1)
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = self._load_meta()
+        self.recovered = False
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    @property
+    def last_id(self):
+        return self.meta['last_id']
+
+    def append(self, rows):
+        columns = [array(typecode) for _, typecode, _ in self.COLUMNS]
+        for answer_id, user_id, question_id, value, create_time in rows:
+            columns[0].append(answer_id)
+            columns[1].append(user_id)
+            columns[2].append(question_id)
+            columns[3].append(value)
+            columns[4].append((create_time - self.EPOCH) // self.MICROSECOND)
+        if not columns[0]:
+            return 0
+        if not self.recovered:
+            self._recover()
+
+        for (name, _, _), column in zip(self.COLUMNS, columns):
+            if sys.byteorder == 'big':
+                column.byteswap()
+            with open(self._get_path(name), 'ab') as f:
+                column.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.meta['rows'] += len(columns[0])
+        self.meta['last_id'] = columns[0][-1]
+        self._save_meta()
+        return len(columns[0])
+
+    def read(self, name):
+        typecode, dtype = self._get_types(name)
+        if not self.rows:
+            return numpy.empty(0, dtype=dtype) if numpy else memoryview(array(typecode))
+        if numpy:
+            return numpy.memmap(self._get_path(name), dtype=dtype, mode='r', shape=(self.rows,))
+
+        with open(self._get_path(name), 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = self.rows * array(typecode).itemsize
+        return memoryview(data)[:size].cast(typecode)
+
+    def _get_types(self, name):
+        for column, typecode, dtype in self.COLUMNS:
+            if column == name:
+                return typecode, dtype
+        raise KeyError(name)
+
+    def _get_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_meta(self):
+        try:
+            with open(self._get_path(self.META_FILENAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'rows': 0, 'last_id': 0}
+
+    def _recover(self):
+        # Drop rows left behind by an export interrupted before the meta file was written.
+        # Only the writer does this, readers may open the export while it is appending.
+        os.makedirs(self.directory, exist_ok=True)
+        for name, typecode, _ in self.COLUMNS:
+            path = self._get_path(name)
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            size = self.rows * array(typecode).itemsize
+            if os.path.getsize(path) > size:
+                os.truncate(path, size)
+        self.recovered = True
+
+    def _save_meta(self):
+        path = self._get_path(self.META_FILENAME)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(path + '.tmp', path)
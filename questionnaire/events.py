@@ -0,0 +1,139 @@
+import json
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+StreamEvent = namedtuple('StreamEvent', ('id', 'kind', 'data', 'user_id'))
+
+
+class LocalEventBackend:
+    def __init__(self):
+        self.events = deque(maxlen=getattr(settings, 'EVENTS_BUFFER_SIZE', 1000))
+        self.condition = threading.Condition()
+        self.last_id = 0
+        self.evicted_id = 0
+
+    def publish(self, kind, data, user_id=None):
+        with self.condition:
+            self._append(StreamEvent(self.last_id + 1, kind, data, user_id))
+
+    def get_last_id(self):
+        return self.last_id
+
+    def wait(self, last_id, timeout):
+        # Returns events newer than last_id, or None when some of them were already evicted
+        with self.condition:
+            if self.last_id <= last_id:
+                self.condition.wait(timeout)
+            if last_id < self.evicted_id:
+                return None
+
+            events = []
+            for event in reversed(self.events):
+                if event.id <= last_id:
+                    break
+                events.append(event)
+            events.reverse()
+            return events
+
+    def _append(self, event):
+        if len(self.events) == self.events.maxlen:
+            self.evicted_id = self.events[0].id
+        self.events.append(event)
+        self.last_id = event.id
+        self.condition.notify_all()
+
+
+class DatabaseEventBackend(LocalEventBackend):
+    # Events are shared between processes through the Event table; one thread
+    # per process polls it and wakes up every stream waiting in the process
+    def __init__(self):
+        super().__init__()
+        self.poll_interval = getattr(settings, 'EVENTS_POLL_INTERVAL', 1)
+        self.gap_timeout = getattr(settings, 'EVENTS_GAP_TIMEOUT', 5)
+        self.gap = None
+        self.thread = None
+
+    def publish(self, kind, data, user_id=None):
+        Event.objects.create(kind=kind, data=json.dumps(data), user_id=user_id)
+
+    def get_last_id(self):
+        self._start()
+        return self.last_id
+
+    def wait(self, last_id, timeout):
+        self._start()
+        return super().wait(last_id, timeout)
+
+    def poll(self):
+        events = Event.objects\
+            .filter(id__gt=self.last_id)\
+            .order_by('id')[:self.events.maxlen]
+        events = [self._to_stream_event(event) for event in events]
+        now = time.monotonic()
+        with self.condition:
+            for event in events:
+                # Ids are assigned before commit, so a missing id may belong to an event that
+                # isn't committed yet. Wait for it up to gap_timeout before skipping it.
+                if event.id != self.last_id + 1 and not self._is_gap_expired(now):
+                    return
+                self.gap = None
+                self._append(event)
+
+    def _is_gap_expired(self, now):
+        if self.gap is None or self.gap[0] != self.last_id:
+            self.gap = (self.last_id, now)
+        return now - self.gap[1] >= self.gap_timeout
+
+    def _start(self):
+        with self.condition:
+            if self.thread is not None:
+                return
+
+            events = list(Event.objects.order_by('-id')[:self.events.maxlen])
+            events.reverse()
+            for event in events:
+                self._append(self._to_stream_event(event))
+            if len(events) == self.events.maxlen:
+                self.evicted_id = events[0].id - 1
+
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Failed to poll events')
+
+    @staticmethod
+    def _to_stream_event(event):
+        return StreamEvent(event.id, event.kind, json.loads(event.data), event.user_id)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(getattr(
+                settings, 'EVENTS_BACKEND', 'questionnaire.events.LocalEventBackend'))()
+    return _backend
+
+
+def publish(kind, data, user_id=None):
+    transaction.on_commit(lambda: get_backend().publish(kind, data, user_id))
@@ -31,6 +31,28 @@ class QuestionFilterForm(forms.Form):
         (TRUE, TRUE),
         (FALSE, FALSE)
     )
+    FIELDS = ('id', 'title', 'can_edit', 'end_time', 'user_answer', 'real_answer')
+    FIELDS_SPLITTER = ','
+
     active = forms.ChoiceField(required=False, choices=BOOLEAN_CHOICES)
     has_answer = forms.ChoiceField(required=False, choices=BOOLEAN_CHOICES)
     title = forms.CharField(required=False, min_length=2)
+    fields = forms.CharField(required=False)
+
+    def clean_fields(self):
+        value = self.cleaned_data['fields']
+        if not value:
+            return None
+
+        fields = []
+        for field in value.split(self.FIELDS_SPLITTER):
+            field = field.strip()
+            if field not in self.FIELDS:
+                raise forms.ValidationError('Unknown field: %s' % field)
+            if field not in fields:
+                fields.append(field)
+        return fields
+
+
+class QuestionSyncForm(forms.Form):
+    since = forms.DateTimeField(required=False)
@@ -0,0 +1,59 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from questionnaire import events
+from questionnaire.models import Question, QuestionSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Freezes questions whose end time has passed into immutable snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--daemon', action='store_true',
+                            help='Keep running and close questions as their deadlines pass')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Maximum number of seconds to sleep between passes in daemon mode')
+        parser.add_argument('--grace', type=float, default=5,
+                            help='Seconds to wait after end time so in-flight answers are saved')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        grace = timedelta(seconds=options['grace'])
+        while True:
+            closed = self.close_expired(grace, options['batch_size'])
+            if closed:
+                self.stdout.write('Closed %d questions' % closed)
+            if not options['daemon']:
+                return
+            time.sleep(self.get_sleep_time(grace, options['interval']))
+
+    @staticmethod
+    def close_expired(grace, batch_size):
+        closed = 0
+        while True:
+            questions = list(Question.objects
+                             .filter(closed=False, end_time__lt=timezone.now() - grace)
+                             .order_by('end_time')[:batch_size])
+            if not questions:
+                return closed
+            for question in questions:
+                with transaction.atomic():
+                    QuestionSnapshot.freeze(question)
+                events.publish('question_closed', question.get_catalog_entry())
+            closed += len(questions)
+
+    @staticmethod
+    def get_sleep_time(grace, interval):
+        next_question = Question.objects\
+            .filter(closed=False)\
+            .order_by('end_time')\
+            .only('end_time')\
+            .first()
+        if next_question is None:
+            return interval
+        seconds = (next_question.end_time + grace - timezone.now()).total_seconds()
+        return min(max(seconds, 0), interval)
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from questionnaire.columnar import AnswerColumns
+from questionnaire.models import Answer
+
+
+class Command(BaseCommand):
+    help = 'Appends new answers to the columnar export used for offline analysis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=getattr(settings, 'ANSWERS_EXPORT_DIR', None),
+                            help='Export directory (defaults to ANSWERS_EXPORT_DIR)')
+        parser.add_argument('--chunk-size', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        columns = AnswerColumns(options['dir'])
+        # Answers can still be edited during MAX_TIME_FOR_EDIT, so only export older rows
+        cutoff = timezone.now() - timedelta(hours=Answer.MAX_TIME_FOR_EDIT)
+        exported = 0
+        while True:
+            rows = Answer.objects\
+                .filter(id__gt=columns.last_id, create_time__lt=cutoff)\
+                .order_by('id')\
+                .values_list('id', 'user_id', 'question_id', 'value', 'create_time')[:options['chunk_size']]
+            appended = columns.append(rows)
+            if not appended:
+                break
+            exported += appended
+
+        self.stdout.write('Exported %d answers, %d in total' % (exported, columns.rows))
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from questionnaire.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Deletes stream events older than EVENTS_TTL'
+
+    def handle(self, *args, **options):
+        deleted = Event.prune(settings.EVENTS_TTL)
+        self.stdout.write('Deleted %d events' % deleted)
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from questionnaire.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Deletes tombstones older than SYNC_TOMBSTONE_TTL'
+
+    def handle(self, *args, **options):
+        deleted = Tombstone.prune(settings.SYNC_TOMBSTONE_TTL)
+        self.stdout.write('Deleted %d tombstones' % deleted)
@@ -0,0 +1,62 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from questionnaire import events
+from questionnaire.models import Answer
+
+
+class Command(BaseCommand):
+    help = 'Publishes consensus_changed events for questions whose answers changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--daemon', action='store_true',
+                            help='Keep running and publish changes every --interval seconds')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Number of seconds to sleep between passes in daemon mode')
+        parser.add_argument('--since', type=float, default=60,
+                            help='Seconds of answer changes to look at in the first pass')
+        parser.add_argument('--overlap', type=float, default=5,
+                            help='Seconds every pass looks back so answers committed late are seen')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(seconds=options['since'])
+        overlap = timedelta(seconds=options['overlap'])
+        published = {}
+        while True:
+            now = timezone.now()
+            count = self.publish_changes(since - overlap, published)
+            if count:
+                self.stdout.write('Published consensus of %d questions' % count)
+            since = now
+            if not options['daemon']:
+                return
+            time.sleep(options['interval'])
+
+    @staticmethod
+    def publish_changes(since, published):
+        # One event per changed question and pass, however many answers it got in between
+        changed = Answer.objects\
+            .filter(update_time__gt=since)\
+            .values('question_id')
+        consensus = Answer.objects\
+            .filter(question_id__in=changed)\
+            .values('question_id')\
+            .annotate(answers_count=Count('id'), consensus=Avg('value'))\
+            .order_by()
+
+        count = 0
+        current = {}
+        for item in consensus:
+            question_id = item.pop('question_id')
+            current[question_id] = item
+            if published.get(question_id) != item:
+                events.publish('consensus_changed', dict(item, question=question_id))
+                count += 1
+        # Questions outside the overlap window are published again only when they change
+        published.clear()
+        published.update(current)
+        return count
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questionnaire', '0003_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='closed',
+            field=models.BooleanField(db_index=True, default=False, editable=False, verbose_name='Closed'),
+        ),
+        migrations.CreateModel(
+            name='QuestionSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('answers_count', models.IntegerField(default=0, verbose_name='Answers count')),
+                ('distribution', models.TextField(default='{}', verbose_name='Answer value distribution')),
+                ('catalog_entry', models.TextField(default='{}', verbose_name='Catalog entry')),
+                ('freeze_time', models.DateTimeField(auto_now=True, verbose_name='Freeze time')),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='questionnaire.Question')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-19 17:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('questionnaire', '0004_question_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='update_time',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Update time'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='update_time',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Update time'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question_id', models.IntegerField(verbose_name='Question ID')),
+                ('delete_time', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Delete time')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
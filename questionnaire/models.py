@@ -1,18 +1,28 @@
+import json
 from datetime import timedelta
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils import timezone
 
+from project import metrics
+
+from .cache import AnsweredQuestionsBitset
 from .validators import NotEqualValueValidator
 
 
 class Question(models.Model):
+    END_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
     title = models.TextField('Question')
     real_answer = models.IntegerField(
         'Real answer', null=True, blank=True,
         validators=[MinValueValidator(0), MaxValueValidator(100), NotEqualValueValidator(50)])
     end_time = models.DateTimeField('End time')
+    closed = models.BooleanField('Closed', default=False, db_index=True, editable=False)
+    update_time = models.DateTimeField('Update time', auto_now=True, db_index=True)
 
     def get_user_answer(self, user=None):
         if hasattr(self, 'user_answer'):
@@ -25,6 +35,14 @@ class Question(models.Model):
         now = timezone.now()
         return self.end_time >= now
 
+    def get_catalog_entry(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'end_time': self.end_time.strftime(self.END_TIME_FORMAT),
+            'real_answer': self.real_answer
+        }
+
     def __str__(self):
         return self.title
 
@@ -39,6 +57,7 @@ class Answer(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(100), NotEqualValueValidator(50)])
 
     create_time = models.DateTimeField('Create time', auto_now_add=True)
+    update_time = models.DateTimeField('Update time', auto_now=True, db_index=True)
 
     def can_edit(self):
         now = timezone.now()
@@ -51,12 +70,102 @@ class Answer(models.Model):
         unique_together = ('user', 'question')
 
 
+class Tombstone(models.Model):
+    question_id = models.IntegerField('Question ID')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    delete_time = models.DateTimeField('Delete time', auto_now_add=True, db_index=True)
+
+    @classmethod
+    def prune(cls, ttl):
+        return cls.objects.filter(delete_time__lt=timezone.now() - ttl).delete()[0]
+
+
+class Event(models.Model):
+    kind = models.CharField('Kind', max_length=32)
+    data = models.TextField('Data', default='{}')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    create_time = models.DateTimeField('Create time', auto_now_add=True, db_index=True)
+
+    @classmethod
+    def prune(cls, ttl):
+        return cls.objects.filter(create_time__lt=timezone.now() - ttl).delete()[0]
+
+
 class Statistics(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     answered_questions = models.IntegerField('Answered questions', default=0)
     unanswered_questions = models.IntegerField('Unanswered questions', default=0)
 
     def recalculate(self):
-        self.answered_questions = self.user.answer_set.count()
+        self.answered_questions = AnsweredQuestionsBitset.get(self.user).count()
         self.unanswered_questions = Question.objects.count() - self.answered_questions
         self.save()
+
+
+class QuestionSnapshot(models.Model):
+    # Cached catalog entries are keyed on the question update_time, so an edited question is
+    # never served from the entry of its previous version cached by another process
+    CACHE_KEY_TMPL = 'question_snapshot:%s:%s'
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='snapshot')
+    answers_count = models.IntegerField('Answers count', default=0)
+    distribution = models.TextField('Answer value distribution', default='{}')
+    catalog_entry = models.TextField('Catalog entry', default='{}')
+    freeze_time = models.DateTimeField('Freeze time', auto_now=True)
+
+    @classmethod
+    def freeze(cls, question):
+        values = question.answer_set\
+            .values_list('value')\
+            .annotate(count=models.Count('id'))\
+            .order_by('value')
+        distribution = dict(values)
+        snapshot = cls.objects.update_or_create(question=question, defaults={
+            'answers_count': sum(distribution.values()),
+            'distribution': json.dumps(distribution),
+            'catalog_entry': json.dumps(question.get_catalog_entry())
+        })[0]
+        Question.objects.filter(id=question.id).update(closed=True)
+        question.closed = True
+        return snapshot
+
+    @classmethod
+    def unfreeze(cls, question):
+        cls.objects.filter(question=question).delete()
+        Question.objects.filter(id=question.id).update(closed=False)
+        question.closed = False
+
+    @classmethod
+    def invalidate(cls, questions):
+        question_ids = list(questions.filter(closed=True).values_list('id', flat=True))
+        cls.objects.filter(question_id__in=question_ids).delete()
+        Question.objects.filter(id__in=question_ids).update(closed=False)
+
+    @classmethod
+    def get_catalog_entries(cls, questions):
+        # Takes (question id, update_time) pairs of closed questions
+        keys = {cls._get_key(question_id, update_time): question_id
+                for question_id, update_time in questions}
+        entries = {keys[key]: entry for key, entry in cache.get_many(keys).items()}
+
+        missing = {question_id: key for key, question_id in keys.items()
+                   if question_id not in entries}
+        metrics.CACHE_REQUESTS.inc('question_snapshot', 'hit', amount=len(entries))
+        metrics.CACHE_REQUESTS.inc('question_snapshot', 'miss', amount=len(missing))
+        if missing:
+            snapshots = cls.objects\
+                .filter(question_id__in=missing)\
+                .values_list('question_id', 'catalog_entry')
+            loaded = {question_id: json.loads(entry) for question_id, entry in snapshots}
+            cache.set_many({missing[question_id]: entry for question_id, entry in loaded.items()},
+                           timeout=cls._get_timeout())
+            entries.update(loaded)
+        return entries
+
+    @classmethod
+    def _get_key(cls, question_id, update_time):
+        return cls.CACHE_KEY_TMPL % (question_id, update_time.timestamp())
+
+    @staticmethod
+    def _get_timeout():
+        return getattr(settings, 'QUESTION_SNAPSHOT_CACHE_TIMEOUT', None)
@@ -0,0 +1,32 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = self._estimate_table_size()
+            if estimate > self.EXACT_COUNT_LIMIT:
+                return estimate
+        return self.object_list.order_by()[:self.EXACT_COUNT_LIMIT].count()
+
+    def _estimate_table_size(self):
+        model = self.object_list.model
+        connection = connections[self.object_list.db]
+        if connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+        elif connection.vendor == 'mysql':
+            sql = 'SELECT table_rows FROM information_schema.tables ' \
+                  'WHERE table_schema = DATABASE() AND table_name = %s'
+        else:
+            return model._default_manager.using(self.object_list.db).aggregate(max_id=Max('pk'))['max_id'] or 0
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [model._meta.db_table])
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] else 0
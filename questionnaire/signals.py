@@ -1,13 +1,85 @@
-from django.db.models.signals import post_save
+import threading
+import time
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
 from threading import Thread
 
-from .models import Answer, Statistics
+from project import metrics
+
+from . import events
+from .cache import AnsweredQuestionsBitset
+from .models import Answer, Question, QuestionSnapshot, Statistics, Tombstone
 
 
 def recalculate_statistics(sender, instance, created, **kwargs):
+    if created:
+        AnsweredQuestionsBitset.add_answer(instance.user_id, instance.question_id)
     statistics = Statistics.objects.get_or_create(user=instance.user)[0]
-    thread = Thread(target=statistics.recalculate)
-    thread.start()
+    thread = Thread(target=_recalculate_statistics, args=(statistics, time.monotonic()))
+    transaction.on_commit(thread.start)
+
+
+def _recalculate_statistics(statistics, queue_time):
+    metrics.STATISTICS_LAG.observe(time.monotonic() - queue_time)
+    statistics.recalculate()
+
+
+def discard_answered_question(sender, instance, **kwargs):
+    AnsweredQuestionsBitset.remove_answer(instance.user_id, instance.question_id)
+
+
+def refresh_question_snapshot(sender, instance, created, **kwargs):
+    if not instance.closed:
+        return
+    if instance.can_answer():
+        QuestionSnapshot.unfreeze(instance)
+    else:
+        QuestionSnapshot.freeze(instance)
+
+
+_deleted_questions = threading.local()
+
+
+def _get_deleted_question_ids():
+    if not hasattr(_deleted_questions, 'ids'):
+        _deleted_questions.ids = set()
+    return _deleted_questions.ids
+
+
+def collect_deleted_question(sender, instance, **kwargs):
+    # Answers deleted together with their question are covered by the question tombstone
+    _get_deleted_question_ids().add(instance.id)
+
+
+def create_question_tombstone(sender, instance, **kwargs):
+    _get_deleted_question_ids().discard(instance.id)
+    Tombstone.objects.create(question_id=instance.id)
+
+
+def create_answer_tombstone(sender, instance, **kwargs):
+    if instance.question_id not in _get_deleted_question_ids():
+        Tombstone.objects.create(question_id=instance.question_id, user_id=instance.user_id)
+
+
+def publish_question_saved(sender, instance, created, **kwargs):
+    events.publish('question_created' if created else 'question_updated', instance.get_catalog_entry())
+
+
+def publish_question_deleted(sender, instance, **kwargs):
+    events.publish('question_deleted', {'id': instance.id})
+
+
+def publish_answer_saved(sender, instance, created, **kwargs):
+    events.publish('answer_saved', {'question': instance.question_id, 'value': instance.value},
+                   instance.user_id)
 
 
 post_save.connect(recalculate_statistics, sender=Answer)
+post_delete.connect(discard_answered_question, sender=Answer)
+post_save.connect(refresh_question_snapshot, sender=Question)
+pre_delete.connect(collect_deleted_question, sender=Question)
+post_delete.connect(create_question_tombstone, sender=Question)
+post_delete.connect(create_answer_tombstone, sender=Answer)
+post_save.connect(publish_question_saved, sender=Question)
+post_delete.connect(publish_question_deleted, sender=Question)
+post_save.connect(publish_answer_saved, sender=Answer)
@@ -1,10 +1,21 @@
+import io
+import os
+import shutil
+import tempfile
 from datetime import timedelta
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
 from unittest import mock
 
-from .models import Question, Answer, Statistics
+from .cache import AnsweredQuestionsBitset
+from .columnar import AnswerColumns
+from .events import DatabaseEventBackend, LocalEventBackend
+from .models import Question, QuestionSnapshot, Answer, Event, Statistics
+from .paginator import EstimatedCountPaginator
 
 
 class TestQuestion(TestCase):
@@ -77,3 +88,269 @@ class TestStatistics(TestCase):
         questions_count = Question.objects.count()
         self.assertEqual(self.statistics.answered_questions + self.statistics.unanswered_questions, questions_count)
         self.assertEqual(self.statistics.answered_questions, self.user.answer_set.count())
+
+
+class TestAnsweredQuestionsBitset(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='test', password='testuser')
+        self.question = Question.objects.create(title='Test title',
+                                                end_time=timezone.now() + timedelta(hours=1))
+        self.answer = Answer.objects.create(user=self.user, question=self.question, value=40)
+
+    def test_add_discard(self):
+        bitset = AnsweredQuestionsBitset()
+        bitset.add(3)
+        bitset.add(17)
+        self.assertIn(3, bitset)
+        self.assertIn(17, bitset)
+        self.assertNotIn(4, bitset)
+        self.assertNotIn(1000, bitset)
+        self.assertEqual(bitset.count(), 2)
+
+        bitset.discard(3)
+        bitset.discard(1000)
+        self.assertNotIn(3, bitset)
+        self.assertEqual(bitset.count(), 1)
+        self.assertEqual(list(bitset), [17])
+
+    def test_get(self):
+        bitset = AnsweredQuestionsBitset.get(self.user)
+        self.assertIn(self.question.id, bitset)
+        self.assertEqual(bitset.count(), 1)
+
+        question = Question.objects.create(title='Test title 2',
+                                           end_time=timezone.now() + timedelta(hours=1))
+        answer = Answer.objects.create(user=self.user, question=question, value=60)
+        with self.assertNumQueries(0):
+            bitset = AnsweredQuestionsBitset.get(self.user)
+        self.assertIn(question.id, bitset)
+        self.assertEqual(bitset.count(), 2)
+
+        answer.delete()
+        bitset = AnsweredQuestionsBitset.get(self.user)
+        self.assertNotIn(question.id, bitset)
+        self.assertEqual(bitset.count(), 1)
+
+    def test_update_locked(self):
+        AnsweredQuestionsBitset.get(self.user)
+        cache.add(AnsweredQuestionsBitset._get_lock_key(self.user.id), True)
+        with mock.patch.object(AnsweredQuestionsBitset, 'LOCK_TIMEOUT', 0):
+            AnsweredQuestionsBitset.remove_answer(self.user.id, self.question.id)
+        self.assertIsNone(cache.get(AnsweredQuestionsBitset._get_key(self.user.id)))
+
+
+class TestQuestionSnapshot(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='test', password='testuser')
+        self.question = Question.objects.create(title='Test title',
+                                                end_time=timezone.now() + timedelta(hours=1))
+        Answer.objects.create(user=self.user, question=self.question, value=40)
+        user = User.objects.create_user(username='test2', password='testuser')
+        Answer.objects.create(user=user, question=self.question, value=40)
+        self.question.end_time = timezone.now() - timedelta(hours=1)
+        self.question.save()
+
+    def test_freeze(self):
+        snapshot = QuestionSnapshot.freeze(self.question)
+        self.assertEqual(snapshot.answers_count, 2)
+        self.assertEqual(snapshot.distribution, '{"40": 2}')
+        self.question.refresh_from_db()
+        self.assertTrue(self.question.closed)
+
+        closed = [(self.question.id, self.question.update_time)]
+        entries = QuestionSnapshot.get_catalog_entries(closed)
+        self.assertEqual(entries, {self.question.id: self.question.get_catalog_entry()})
+        with self.assertNumQueries(0):
+            QuestionSnapshot.get_catalog_entries(closed)
+
+    def test_refresh(self):
+        QuestionSnapshot.freeze(self.question)
+        QuestionSnapshot.get_catalog_entries([(self.question.id, self.question.update_time)])
+        self.question.real_answer = 80
+        self.question.save()
+        entries = QuestionSnapshot.get_catalog_entries([(self.question.id, self.question.update_time)])
+        self.assertEqual(entries[self.question.id]['real_answer'], 80)
+
+        self.question.end_time = timezone.now() + timedelta(hours=1)
+        self.question.save()
+        self.question.refresh_from_db()
+        self.assertFalse(self.question.closed)
+        self.assertFalse(QuestionSnapshot.objects.filter(question=self.question).exists())
+
+    def test_close_questions(self):
+        open_question = Question.objects.create(title='Test title 2',
+                                                end_time=timezone.now() + timedelta(hours=1))
+        call_command('close_questions', stdout=io.StringIO())
+        self.assertEqual(list(Question.objects.filter(closed=True)), [self.question])
+        self.assertTrue(QuestionSnapshot.objects.filter(question=self.question).exists())
+        self.assertFalse(QuestionSnapshot.objects.filter(question=open_question).exists())
+
+
+class TestAnswerColumns(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.user = User.objects.create_user(username='test', password='testuser')
+        self.questions = [Question.objects.create(title='Test title %d' % i,
+                                                  end_time=timezone.now() + timedelta(hours=1))
+                          for i in range(3)]
+        self.create_time = timezone.now() - timedelta(days=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_answer(self, question, value):
+        answer = Answer.objects.create(user=self.user, question=question, value=value)
+        Answer.objects.filter(id=answer.id).update(create_time=self.create_time)
+        return answer
+
+    def test_export_answers(self):
+        first = self.create_answer(self.questions[0], 10)
+        self.create_answer(self.questions[1], 90)
+        Answer.objects.create(user=self.user, question=self.questions[2], value=60)
+        call_command('export_answers', dir=self.directory, chunk_size=1, stdout=io.StringIO())
+
+        columns = AnswerColumns(self.directory)
+        self.assertEqual(columns.rows, 2)
+        self.assertEqual(list(columns.read('value')), [10, 90])
+        self.assertEqual(list(columns.read('question_id')), [q.id for q in self.questions[:2]])
+        self.assertEqual(columns.read('id')[0], first.id)
+        self.assertEqual(columns.read('create_time')[0],
+                         (self.create_time - AnswerColumns.EPOCH) // AnswerColumns.MICROSECOND)
+
+        Answer.objects.filter(question=self.questions[2]).update(create_time=self.create_time)
+        call_command('export_answers', dir=self.directory, stdout=io.StringIO())
+        columns = AnswerColumns(self.directory)
+        self.assertEqual(list(columns.read('value')), [10, 90, 60])
+
+    def test_recover(self):
+        self.create_answer(self.questions[0], 10)
+        call_command('export_answers', dir=self.directory, stdout=io.StringIO())
+        with open(os.path.join(self.directory, 'value'), 'ab') as f:
+            f.write(b'\x5a')
+
+        columns = AnswerColumns(self.directory)
+        self.assertEqual(list(columns.read('value')), [10])
+        self.assertEqual(os.path.getsize(os.path.join(self.directory, 'value')), 2)
+
+        self.create_answer(self.questions[1], 90)
+        call_command('export_answers', dir=self.directory, stdout=io.StringIO())
+        self.assertEqual(list(AnswerColumns(self.directory).read('value')), [10, 90])
+
+        missing = os.path.join(self.directory, 'missing')
+        self.assertEqual(AnswerColumns(missing).rows, 0)
+        self.assertFalse(os.path.exists(missing))
+
+
+class TestAdmin(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='testuser')
+        self.client.force_login(self.user)
+        self.questions = [Question.objects.create(title='Test title %d' % i,
+                                                  end_time=timezone.now() + timedelta(hours=1))
+                          for i in range(3)]
+        self.answer = Answer.objects.create(user=self.user, question=self.questions[0], value=40)
+
+    def test_question_changelist(self):
+        response = self.client.get(reverse('admin:questionnaire_question_changelist'))
+        self.assertEqual(response.status_code, 200)
+        question = next(obj for obj in response.context['cl'].result_list if obj.id == self.questions[0].id)
+        self.assertEqual(question.answers_count, 1)
+        self.assertEqual(question.consensus, 40)
+
+    @mock.patch('questionnaire.events.publish')
+    def test_resolve(self, publish):
+        QuestionSnapshot.freeze(self.questions[0])
+        response = self.client.post(reverse('admin:questionnaire_question_changelist'), {
+            'action': 'resolve_yes',
+            '_selected_action': [self.questions[0].id, self.questions[1].id]
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Question.objects.filter(real_answer=100).count(), 2)
+        self.assertEqual(sorted(call[0][1]['id'] for call in publish.call_args_list),
+                         [self.questions[0].id, self.questions[1].id])
+        self.assertTrue(all(call[0][0] == 'question_updated' for call in publish.call_args_list))
+        self.assertFalse(QuestionSnapshot.objects.exists())
+        self.assertFalse(Question.objects.filter(closed=True).exists())
+
+    def test_answer_changelist(self):
+        url = reverse('admin:questionnaire_answer_changelist')
+        response = self.client.get(url, {'question': self.questions[0].id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['cl'].result_list), [self.answer])
+        self.assertContains(response, 'About 1 answers')
+
+        response = self.client.get(url, {'question': self.questions[1].id})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+        response = self.client.get(url, {'id__lt': self.answer.id})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+        self.assertIsNotNone(response.context['cl'].first_page_url)
+
+    @mock.patch('questionnaire.paginator.EstimatedCountPaginator.EXACT_COUNT_LIMIT', 1)
+    def test_paginator(self):
+        paginator = EstimatedCountPaginator(Question.objects.all(), 2)
+        self.assertEqual(paginator.count, self.questions[-1].id)
+
+        paginator = EstimatedCountPaginator(Question.objects.filter(title__icontains='title'), 2)
+        self.assertEqual(paginator.count, 1)
+
+
+class TestEventBackends(TransactionTestCase):
+    @override_settings(EVENTS_BUFFER_SIZE=2)
+    def test_local_backend(self):
+        backend = LocalEventBackend()
+        backend.publish('question_created', {'id': 1})
+        backend.publish('answer_saved', {'question': 1}, user_id=1)
+        events = backend.wait(0, timeout=0)
+        self.assertEqual([event.kind for event in events], ['question_created', 'answer_saved'])
+        self.assertEqual(events[1].user_id, 1)
+        self.assertEqual(backend.wait(backend.get_last_id(), timeout=0.01), [])
+
+        backend.publish('question_deleted', {'id': 1})
+        self.assertIsNone(backend.wait(0, timeout=0))
+        self.assertEqual([event.kind for event in backend.wait(1, timeout=0)],
+                         ['answer_saved', 'question_deleted'])
+
+    def test_database_backend(self):
+        backend = DatabaseEventBackend()
+        backend.publish('question_deleted', {'id': 1})
+        event = Event.objects.get(kind='question_deleted')
+        self.assertEqual(event.data, '{"id": 1}')
+
+        backend.poll()
+        self.assertEqual(backend.wait(0, timeout=0)[-1].data, {'id': 1})
+
+    @override_settings(EVENTS_GAP_TIMEOUT=60)
+    def test_database_backend_gap(self):
+        backend = DatabaseEventBackend()
+        backend.publish('question_created', {'id': 1})
+        backend.poll()
+        first_id = backend.get_last_id()
+        Event.objects.create(id=first_id + 2, kind='question_created', data='{"id": 3}')
+        backend.poll()
+        self.assertEqual(backend.last_id, first_id)
+
+        Event.objects.create(id=first_id + 1, kind='question_created', data='{"id": 2}')
+        backend.poll()
+        self.assertEqual([event.data['id'] for event in backend.wait(first_id, timeout=0)], [2, 3])
+
+        Event.objects.create(id=first_id + 4, kind='question_created', data='{"id": 5}')
+        backend.poll()
+        with mock.patch.object(backend, 'gap_timeout', 0):
+            backend.poll()
+        self.assertEqual(backend.last_id, first_id + 4)
+
+    def test_signals(self):
+        user = User.objects.create_user(username='test', password='testuser')
+        question = Question.objects.create(title='Test title',
+                                           end_time=timezone.now() + timedelta(hours=1))
+        Answer.objects.create(user=user, question=question, value=40)
+        self.assertEqual(list(Event.objects.values_list('kind', flat=True)),
+                         ['question_created', 'answer_saved'])
+
+        call_command('publish_consensus', stdout=io.StringIO())
+        self.assertEqual(Event.objects.get(kind='consensus_changed').data,
+                         '{"answers_count": 1, "consensus": 40.0, "question": %d}' % question.id)